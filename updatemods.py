@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 import argparse
+import errno
+import json
+import mmap
+import os
+import queue
 import re
+import stat
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
-from shutil import rmtree
+from shutil import copyfileobj, rmtree
 from time import time
+from typing import Optional
 from urllib.parse import urlparse
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, BadZipFile, ZipFile
 
+import msgspec
 import requests
+from requests.adapters import HTTPAdapter
 from packaging import version
-from xxhash import xxh64
+from xxhash import xxh3_64, xxh64
 from yaml import load as _loadyaml
 
 
@@ -23,75 +35,291 @@ except ImportError:
 loadyaml = partial(_loadyaml, Loader=YamlLoader)
 
 
+# everest.yaml fields are all strings, and a version like 1.10 would lose
+# its trailing zero if it were read as a float
+class ManifestLoader(YamlLoader):
+    pass
+
+
+for _tag in ("tag:yaml.org,2002:int", "tag:yaml.org,2002:float"):
+    ManifestLoader.add_constructor(_tag, ManifestLoader.construct_yaml_str)
+
+# orjson is much faster than the standard library for the update cache
+try:
+    from orjson import dumps as dumpjson
+    from orjson import loads as loadjson
+except ImportError:
+    from json import loads as loadjson
+
+    def dumpjson(obj):
+        return json.dumps(obj).encode()
+
+
+# libdeflate inflates considerably faster than zlib, use it when available
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+
 # constants
 BUF_SIZE = 64 * 1024
+WRITE_BUF_SIZE = 1024 * 1024
+DEFLATE_MAX_SIZE = 4 * 1024 * 1024
+CALLBACK_INTERVAL = 16
+PRINT_INTERVAL = 0.1
+MULTI_PRINT_INTERVAL = 2.0
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+RANGE_WORKERS = 4
+YAML_WORKERS = 16
+UPDATE_WORKERS = 4
+RANGE_MIN_SIZE = 8 * 1024 * 1024
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache", "grimper")
+COPY_RANGE_FALLBACK_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
+TMPFS_PATH = "/dev/shm"
+TMPFS_MAX_SIZE = 256 * 1024 * 1024
 UPDATE_LOCATION_URL = "https://everestapi.github.io/modupdater.txt"
 MIRROR_URL = "https://celestemodupdater.0x0a.de/banana-mirror/%d.zip"
+FILENAME_RE = re.compile(r"filename\*?=([^;]+)", re.IGNORECASE)
 
 
-class RequestDownloader:
-    def __init__(self, callback=None):
-        self._session = requests.Session()
-        self._last_printer_update = time()
-        if callback is None:
-            self._callback = self.default_printer
+def preallocate(fd, size):
+    # reserve the blocks in one go rather than growing the file per write
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            # running out of space should fail early, not halfway through
+            if e.errno == errno.ENOSPC:
+                raise
+
+
+class RangeNotSupportedError(Exception):
+    pass
+
+
+class DownloadState:
+    __slots__ = ("name", "total_bytes", "last_update", "prefix", "divisor", "unit")
+
+    def __init__(self, name, total_bytes):
+        self.name = name
+        self.total_bytes = total_bytes
+        self.last_update = time()
+        # the title and unit only depend on the download, not the progress
+        self.prefix = f"[{name}] " if name else ""
+        if not total_bytes or total_bytes < 1e3:
+            self.divisor, self.unit = 1, ""
+        elif total_bytes < 1e6:
+            self.divisor, self.unit = 1e3, " KB"
         else:
-            self._callback = callback
+            self.divisor, self.unit = 1e6, " MB"
+
 
-    def default_printer(self, dl_name, byte_count, total_bytes):
-        title = ""
-        if dl_name:
-            title = f"[{dl_name}] "
+class RequestDownloader:
+    def __init__(self, callback=None, session=None):
+        if session is None:
+            session = requests.Session()
+        self._session = session
+        self._callback = callback
+        # concurrent downloads share the terminal
+        self._print_lock = threading.Lock()
+        self._active = 0
+        self._line_open = False
+
+    def default_printer(self, state, byte_count, final=False):
+        interval = PRINT_INTERVAL if self._active <= 1 else MULTI_PRINT_INTERVAL
+        now = time()
+        if not final and now - state.last_update < interval:
+            return
+        state.last_update = now
+
+        total_bytes = state.total_bytes
         percentage = ""
         if total_bytes:
             percentage = f" ({round(100*byte_count/total_bytes)}%)"
-        if total_bytes < 1e3:
-            print(f"\r{title}{byte_count}{percentage}", end="")
-        elif total_bytes < 1e6:
-            print(f"\r{title}{byte_count//1e3} KB{percentage}", end="")
+        if state.divisor == 1:
+            line = f"{state.prefix}{byte_count}{percentage}"
+        else:
+            line = f"{state.prefix}{byte_count//state.divisor}{state.unit}{percentage}"
+        with self._print_lock:
+            if self._active > 1:
+                # a \r line would be overwritten by the other downloads
+                self._close_line()
+                print(line)
+            else:
+                print(f"\r{line}", end="\n" if final else "")
+                self._line_open = not final
+
+    def _close_line(self):
+        if self._line_open:
+            print("")
+            self._line_open = False
+
+    def message(self, text):
+        with self._print_lock:
+            self._close_line()
+            print(text)
+
+    def _report(self, state, byte_count, final=False):
+        if self._callback is None:
+            self.default_printer(state, byte_count, final)
         else:
-            print(f"\r{title}{byte_count//1e6} MB{percentage}", end="")
+            self._callback(state.name, byte_count, state.total_bytes)
+            if final:
+                print("")
+
+    def download(
+        self, url, dl_name=None, output_filepath=None, total_bytes=None, hasher=None
+    ):
+        with self._print_lock:
+            self._active += 1
+        try:
+            self._download(url, dl_name, output_filepath, total_bytes, hasher)
+        finally:
+            with self._print_lock:
+                self._active -= 1
 
-    def download(self, url, dl_name=None, output_filepath=None, total_bytes=None):
+    def _download(self, url, dl_name, output_filepath, total_bytes, hasher):
         backup_output_filepath = None
         if output_filepath is None:
             path_parts = url.split("://", 1)[1].split("/")
             if len(path_parts) > 1:
                 backup_output_filepath = path_parts[-1]
-        byte_count = 0
         with self._session.get(url, stream=True) as req:
             req.raise_for_status()
             if output_filepath is None:
                 cd_header = req.headers.get("Content-Disposition")
                 if cd_header is not None:
-                    if "filename" in cd_header:
-                        fname = re.findall(
-                            r"filename\*?=([^;]+)", cd_header, flags=re.IGNORECASE
-                        )
+                    fname = FILENAME_RE.findall(cd_header)
+                    if fname:
                         output_filepath = fname[0].strip().strip('"')
                 if not output_filepath:
                     if backup_output_filepath is None:
                         raise ValueError(f"No valid filepath provided for {url}.")
                     output_filepath = backup_output_filepath
+            content_length = None
+            cl_header = req.headers.get("Content-Length")
+            if cl_header is not None:
+                content_length = int(cl_header)
             if total_bytes is None:
-                cl_header = req.headers.get("Content-Length")
-                if cl_header is not None:
-                    total_bytes = int(cl_header)
-            with open(output_filepath, "wb", buffering=0) as of:
-                with memoryview(bytearray(BUF_SIZE)) as mv:
-                    while True:
-                        num_bytes = req.raw.readinto(mv)
-                        if not num_bytes:
-                            self._callback(dl_name, byte_count, total_bytes)
-                            print("")
-                            break
-                        elif num_bytes < BUF_SIZE:
-                            with mv[:num_bytes] as smv:
-                                of.write(smv)
-                        else:
-                            of.write(mv)
-                        byte_count += num_bytes
-                        self._callback(dl_name, byte_count, total_bytes)
+                total_bytes = content_length
+            state = DownloadState(dl_name, total_bytes)
+            # split large files into parallel range requests when possible
+            if not (
+                content_length
+                and content_length >= RANGE_MIN_SIZE
+                and req.headers.get("Accept-Ranges") == "bytes"
+                and "Content-Encoding" not in req.headers
+            ):
+                self._download_sequential(req, state, output_filepath, hasher)
+                return
+            range_url = req.url
+
+        try:
+            self._download_ranges(
+                range_url, state, output_filepath, content_length, hasher
+            )
+            return
+        except RangeNotSupportedError:
+            self.message(
+                f"Server ignored range request, downloading {url} sequentially."
+            )
+        with self._session.get(url, stream=True) as req:
+            req.raise_for_status()
+            self._download_sequential(req, state, output_filepath, hasher)
+
+    def _download_sequential(self, req, state, output_filepath, hasher):
+        total_bytes = state.total_bytes
+        byte_count = 0
+        chunk_count = 0
+        # small network reads are coalesced into large write(2) calls
+        with open(output_filepath, "wb", buffering=WRITE_BUF_SIZE) as of:
+            if total_bytes:
+                preallocate(of.fileno(), total_bytes)
+            with memoryview(bytearray(BUF_SIZE)) as mv:
+                while True:
+                    num_bytes = req.raw.readinto(mv)
+                    if not num_bytes:
+                        # drop any preallocated space the data didn't fill
+                        of.truncate()
+                        self._report(state, byte_count, final=True)
+                        break
+                    with mv[:num_bytes] as smv:
+                        if hasher is not None:
+                            hasher.update(smv)
+                        of.write(smv)
+                    byte_count += num_bytes
+                    chunk_count += 1
+                    if chunk_count % CALLBACK_INTERVAL == 0:
+                        self._report(state, byte_count)
+
+    def _download_ranges(self, url, state, output_filepath, total_bytes, hasher):
+        part_size = -(-total_bytes // RANGE_WORKERS)
+        ranges = [
+            (lo, min(lo + part_size, total_bytes) - 1)
+            for lo in range(0, total_bytes, part_size)
+        ]
+        lock = threading.Lock()
+        abort = threading.Event()
+        byte_count = 0
+        chunk_count = 0
+
+        def progress(num_bytes):
+            nonlocal byte_count, chunk_count
+            with lock:
+                byte_count += num_bytes
+                chunk_count += 1
+                if chunk_count % CALLBACK_INTERVAL == 0:
+                    self._report(state, byte_count)
+
+        with open(output_filepath, "wb", buffering=0) as of:
+            of.truncate(total_bytes)
+            fd = of.fileno()
+            preallocate(fd, total_bytes)
+            with ThreadPoolExecutor(max_workers=RANGE_WORKERS) as pool:
+                futures = [
+                    pool.submit(self._download_range, url, fd, lo, hi, progress, abort)
+                    for lo, hi in ranges
+                ]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    # stop the other parts rather than finishing them
+                    abort.set()
+                    raise
+        self._report(state, byte_count, final=True)
+
+        # the parts arrive out of order, so hash the finished file instead
+        if isinstance(hasher, ChunkedXXH3):
+            hasher.update_file(output_filepath)
+        elif hasher is not None:
+            with open(output_filepath, "rb") as f:
+                for block in iter(partial(f.read, 2**18), b""):
+                    hasher.update(block)
+
+    def _download_range(self, url, fd, lo, hi, progress, abort):
+        headers = {"Range": f"bytes={lo}-{hi}"}
+        with self._session.get(url, headers=headers, stream=True) as req:
+            req.raise_for_status()
+            if req.status_code != 206:
+                raise RangeNotSupportedError(url)
+            offset = lo
+            with memoryview(bytearray(BUF_SIZE)) as mv:
+                while True:
+                    if abort.is_set():
+                        return
+                    num_bytes = req.raw.readinto(mv)
+                    if not num_bytes:
+                        break
+                    with mv[:num_bytes] as smv:
+                        written = 0
+                        while written < num_bytes:
+                            written += os.pwrite(fd, smv[written:], offset + written)
+                    offset += num_bytes
+                    progress(num_bytes)
+        if offset != hi + 1:
+            raise requests.ConnectionError(f"Incomplete range {lo}-{hi} for {url}.")
 
 
 def get_id_from_url(url):
@@ -101,23 +329,67 @@ def get_id_from_url(url):
     return None
 
 
+class ModDependency(msgspec.Struct):
+    Name: str
+    Version: str = ""
+
+
+class ModManifest(msgspec.Struct):
+    Name: str
+    Version: str = ""
+    DLL: Optional[str] = None
+    Dependencies: list[ModDependency] = []
+
+
+class ModManifestCache(msgspec.Struct):
+    mtime_ns: int
+    size: int
+    mods: list[ModManifest]
+
+
 def get_mod_yaml(loc):
-    yamlpath = loc / "everest.yaml"
-    if not yamlpath.exists():
-        yamlpath = loc / "everest.yml"
-        if not yamlpath.exists():
-            return None
-    with yamlpath.open() as f:
-        yaml = loadyaml(f)
+    for name in ("everest.yaml", "everest.yml"):
+        yamlpath = os.path.join(loc, name)
+        try:
+            st = os.stat(yamlpath)
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        return None
+
+    # a msgpack copy next to the yaml skips parsing it on later runs
+    cachepath = f"{yamlpath}.mp"
+    try:
+        with open(cachepath, "rb") as f:
+            cache = msgspec.msgpack.decode(f.read(), type=ModManifestCache)
+        if cache.mtime_ns == st.st_mtime_ns and cache.size == st.st_size:
+            return cache.mods
+    except (OSError, msgspec.DecodeError):
+        pass
+
+    with open(yamlpath, "rb") as f:
+        yaml = msgspec.convert(
+            _loadyaml(f, Loader=ManifestLoader), type=list[ModManifest]
+        )
 
     assert yaml
+    try:
+        with open(cachepath, "wb") as f:
+            f.write(
+                msgspec.msgpack.encode(
+                    ModManifestCache(st.st_mtime_ns, st.st_size, yaml)
+                )
+            )
+    except OSError:
+        pass
     return yaml
 
 
-def xxhsum(f):
+def xxhsum(f, algorithm=xxh3_64):
     buf = bytearray(2**18)
     view = memoryview(buf)
-    hash = xxh64()
+    hash = algorithm()
     while True:
         size = f.readinto(buf)
         if size == 0:
@@ -127,154 +399,632 @@ def xxhsum(f):
     return hash.hexdigest()
 
 
+class ChunkedXXH3:
+    """Streaming equivalent of parallel_xxhsum, usable while downloading."""
+
+    def __init__(self):
+        self._digests = []
+        self._chunk = xxh3_64()
+        self._chunk_size = 0
+
+    def update(self, data):
+        with memoryview(data) as mv:
+            while mv:
+                take = min(len(mv), HASH_CHUNK_SIZE - self._chunk_size)
+                self._chunk.update(mv[:take])
+                self._chunk_size += take
+                mv = mv[take:]
+                if self._chunk_size == HASH_CHUNK_SIZE:
+                    self._digests.append(self._chunk.digest())
+                    self._chunk = xxh3_64()
+                    self._chunk_size = 0
+
+    def update_file(self, path):
+        # hashes a complete file on all cores; only valid on a fresh hasher
+        assert not self._digests and not self._chunk_size
+        self._digests = _chunk_digests(path)
+
+    def hexdigest(self):
+        digests = self._digests
+        if self._chunk_size:
+            digests = digests + [self._chunk.digest()]
+        return xxh3_64(b"".join(digests)).hexdigest()
+
+
+def _chunk_digests(path, workers=os.cpu_count()):
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as mv:
+                chunks = [
+                    mv[start : start + HASH_CHUNK_SIZE]
+                    for start in range(0, size, HASH_CHUNK_SIZE)
+                ]
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    digests = list(
+                        pool.map(lambda chunk: xxh3_64(chunk).digest(), chunks)
+                    )
+                for chunk in chunks:
+                    chunk.release()
+
+    return digests
+
+
+def parallel_xxhsum(path, workers=os.cpu_count()):
+    # the file is hashed in fixed-size chunks, so the root digest depends only
+    # on the file contents, never on the number of workers
+    return xxh3_64(b"".join(_chunk_digests(path, workers))).hexdigest()
+
+
+def get_staging_dir(save_path, size):
+    # keep archives in memory when they're small enough, they are deleted
+    # right after extraction anyway
+    if size and size <= TMPFS_MAX_SIZE and os.path.isdir(TMPFS_PATH):
+        path = os.path.join(TMPFS_PATH, f"grimper-{os.getuid()}")
+        try:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            st = os.lstat(path)
+        except OSError:
+            return save_path
+        # the name is predictable, so only trust a private directory we own
+        if (
+            stat.S_ISDIR(st.st_mode)
+            and st.st_uid == os.getuid()
+            and not st.st_mode & 0o077
+        ):
+            # /dev/shm is often tiny in containers
+            vfs = os.statvfs(path)
+            if vfs.f_bavail * vfs.f_frsize >= size:
+                return path
+        else:
+            print(f"Warning: not using insecure staging directory {path}!")
+    return save_path
+
+
+def _member_path(dirpath, info):
+    # sanitize the member name the same way ZipFile.extract does
+    arcname = info.filename.replace("/", os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid_path_parts = ("", os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(
+        x for x in arcname.split(os.path.sep) if x not in invalid_path_parts
+    )
+    return os.path.join(dirpath, arcname)
+
+
+def _member_data_offset(f, info):
+    f.seek(info.header_offset)
+    header = f.read(30)
+    if header[:4] != b"PK\x03\x04":
+        raise BadZipFile(f"Bad magic number for file header of {info.filename!r}")
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    return info.header_offset + 30 + name_len + extra_len
+
+
+def _read_raw_member(f, info):
+    f.seek(_member_data_offset(f, info))
+    return f.read(info.compress_size)
+
+
+def copy_range(src_fd, dst_fd, offset, size):
+    # let the kernel move the data when it can, it never enters user space
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                num_bytes = os.copy_file_range(
+                    src_fd, dst_fd, size - copied, offset + copied
+                )
+                if not num_bytes:
+                    raise BadZipFile("Unexpected end of archive")
+                copied += num_bytes
+            return
+        except OSError as e:
+            if e.errno not in COPY_RANGE_FALLBACK_ERRORS:
+                raise
+    while copied < size:
+        data = os.pread(src_fd, min(size - copied, 2**18), offset + copied)
+        if not data:
+            raise BadZipFile("Unexpected end of archive")
+        with memoryview(data) as mv:
+            written = 0
+            while written < len(data):
+                written += os.write(dst_fd, mv[written:])
+        copied += len(data)
+
+
+def _extract_members(filepath, dirpath, verified, members):
+    # every worker needs its own ZipFile, they can't share a file position
+    with open(filepath, "rb") as f, ZipFile(f) as zf:
+        for info in members:
+            targetpath = _member_path(dirpath, info)
+            encrypted = info.flag_bits & 0x1
+            if verified and info.compress_type == ZIP_STORED and not encrypted:
+                # the archive hash was checked already, so skip the CRC here
+                offset = _member_data_offset(f, info)
+                with open(targetpath, "wb") as dst:
+                    copy_range(f.fileno(), dst.fileno(), offset, info.file_size)
+            elif (
+                deflate is not None
+                and info.compress_type == ZIP_DEFLATED
+                and not encrypted
+                # libdeflate needs whole buffers, so stream large members
+                and info.file_size <= DEFLATE_MAX_SIZE
+                and info.compress_size <= DEFLATE_MAX_SIZE
+            ):
+                out = deflate.deflate_decompress(
+                    _read_raw_member(f, info), info.file_size
+                )
+                if deflate.crc32(out) != info.CRC:
+                    raise BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+                with open(targetpath, "wb") as dst:
+                    dst.write(out)
+            else:
+                with zf.open(info) as src, open(targetpath, "wb") as dst:
+                    copyfileobj(src, dst, 2**18)
+
+
+def extract_zip(filepath, dirpath, verified=False, workers=os.cpu_count() or 1):
+    with ZipFile(filepath) as zf:
+        infos = zf.infolist()
+
+    # create the directory tree up front so the workers only write files
+    dirs = set()
+    files = []
+    for info in infos:
+        targetpath = _member_path(dirpath, info)
+        if info.is_dir():
+            dirs.add(targetpath)
+        elif targetpath != os.path.join(dirpath, ""):
+            dirs.add(os.path.dirname(targetpath))
+            files.append(info)
+    for path in sorted(dirs):
+        os.makedirs(path, exist_ok=True)
+
+    # deal the largest members out first to balance the workers
+    files.sort(key=lambda info: info.file_size, reverse=True)
+    batches = [files[i::workers] for i in range(min(workers, len(files)))]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        extract = partial(_extract_members, filepath, dirpath, verified)
+        for _ in pool.map(extract, batches):
+            pass
+
+
+def hash_file(path, algorithm):
+    if algorithm is ChunkedXXH3:
+        return parallel_xxhsum(path)
+    with open(path, "rb") as f:
+        return xxhsum(f, algorithm)
+
+
+class ModData:
+    __slots__ = (
+        "name",
+        "mirror_url",
+        "url",
+        "version",
+        "xxhashes",
+        "xxhashes3",
+        "xxhashes3_chunked",
+        "size",
+        "gbid",
+        "file_id",
+    )
+
+    def __init__(
+        self,
+        name,
+        mirror_url,
+        url,
+        version=None,
+        xxhashes=None,
+        xxhashes3=None,
+        xxhashes3_chunked=None,
+        size=None,
+        gbid=None,
+        file_id=None,
+    ):
+        self.name = name
+        self.mirror_url = mirror_url
+        self.url = url
+        self.version = version
+        self.xxhashes = xxhashes
+        self.xxhashes3 = xxhashes3
+        self.xxhashes3_chunked = xxhashes3_chunked
+        self.size = size
+        self.gbid = gbid
+        self.file_id = file_id
+
+
+class ManifestTable:
+    """Update data stored as one list per field instead of a dict per mod."""
+
+    # column name -> key in the server's update yaml
+    COLUMNS = {
+        "mirror_urls": "MirrorURL",
+        "urls": "URL",
+        "versions": "Version",
+        "xxhashes": "xxHash",
+        "xxhashes3": "xxHash3",
+        "xxhashes3_chunked": "xxHash3Chunked",
+        "sizes": "Size",
+        "gbids": "GameBananaId",
+        "file_ids": "GameBananaFileId",
+    }
+
+    __slots__ = ("names", *COLUMNS, "name_idx", "gbid_idx", "file_id_idx")
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = {"names": [], **{column: [] for column in self.COLUMNS}}
+        self.names = columns["names"]
+        for column in self.COLUMNS:
+            values = columns[column]
+            if len(values) != len(self.names):
+                raise ValueError(f"Column {column} has the wrong length.")
+            setattr(self, column, values)
+        self.name_idx = {name: i for i, name in enumerate(self.names)}
+        # several entries can share a mod id; the first one wins
+        self.gbid_idx = {}
+        for i, gbid in enumerate(self.gbids):
+            if gbid:
+                self.gbid_idx.setdefault(gbid, i)
+        self.file_id_idx = {}
+        for i, file_id in enumerate(self.file_ids):
+            if file_id:
+                self.file_id_idx.setdefault(file_id, i)
+
+    @classmethod
+    def from_yaml(cls, manifest):
+        columns = {"names": list(manifest)}
+        for column, key in cls.COLUMNS.items():
+            columns[column] = [data.get(key) for data in manifest.values()]
+        return cls(columns)
+
+    def columns(self):
+        return {column: getattr(self, column) for column in ("names", *self.COLUMNS)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _row(self, i):
+        if i is None:
+            return None
+        return ModData(
+            self.names[i],
+            self.mirror_urls[i],
+            self.urls[i],
+            version=self.versions[i],
+            xxhashes=self.xxhashes[i],
+            xxhashes3=self.xxhashes3[i],
+            xxhashes3_chunked=self.xxhashes3_chunked[i],
+            size=self.sizes[i],
+            gbid=self.gbids[i],
+            file_id=self.file_ids[i],
+        )
+
+    def by_name(self, modname):
+        return self._row(self.name_idx.get(modname))
+
+    def by_gbid(self, gbid):
+        return self._row(self.gbid_idx.get(gbid))
+
+    def by_file_id(self, file_id):
+        return self._row(self.file_id_idx.get(file_id))
+
+
 class ModUpdater:
     def __init__(self):
-        self.dlr = RequestDownloader()
-        self.__cached_update_by_modname = dict()
-        self.__cached_update_by_gbid = dict()
+        # one session for everything, so connections to a host are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=UPDATE_WORKERS * RANGE_WORKERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.dlr = RequestDownloader(session=self.session)
+        self.__cached_update = ManifestTable()
         try:
             with open("disabledlevelsets.txt") as f:
                 self.__disabled_levelsets = set([line.strip() for line in f])
         except FileNotFoundError:
             self.__disabled_levelsets = set()
 
+    def _cached_update_headers(self, update_url):
+        try:
+            with open(CACHE_DIR / "update.meta") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if meta.get("url") != update_url:
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def _load_update_cache(self):
+        try:
+            columns = loadjson((CACHE_DIR / "manifest.json").read_bytes())
+            self.__cached_update = ManifestTable(columns)
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def _save_update_cache(self, update_url, headers):
+        meta = {
+            "url": update_url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            (CACHE_DIR / "manifest.json").write_bytes(
+                dumpjson(self.__cached_update.columns())
+            )
+            with open(CACHE_DIR / "update.meta", "w") as f:
+                json.dump(meta, f)
+        except (OSError, TypeError) as e:
+            print(f"Warning: could not cache update data: {e}")
+
     def _download_update(self):
         print("Getting update URL from server...")
-        with requests.get(UPDATE_LOCATION_URL) as req:
+        with self.session.get(UPDATE_LOCATION_URL) as req:
             req.raise_for_status()
             update_url = req.text.strip()
         print("Got update URL, fetching update data...")
-        with requests.get(update_url, stream=True) as req:
+        headers = self._cached_update_headers(update_url)
+        with self.session.get(update_url, headers=headers, stream=True) as req:
             req.raise_for_status()
+            if req.status_code == 304 and self._load_update_cache():
+                print("Update data unchanged, using cached copy.")
+                return
+            resp_headers = req.headers
             resp = req.text
+        if not resp:
+            # the cached copy was unusable, fetch everything again
+            with self.session.get(update_url, stream=True) as req:
+                req.raise_for_status()
+                resp_headers = req.headers
+                resp = req.text
         print("Got update data, parsing yaml...")
-        self.__cached_update_by_modname = loadyaml(resp)
-        for modname, data in self.__cached_update_by_modname.items():
-            data["Name"] = modname
-            if gbid := data.get("GameBananaId"):
-                if gbid not in self.__cached_update_by_gbid:
-                    self.__cached_update_by_gbid[gbid] = data
+        self.__cached_update = ManifestTable.from_yaml(loadyaml(resp))
+        self._save_update_cache(update_url, resp_headers)
 
     def update_data_for_mod(self, modname):
-        if not self.__cached_update_by_modname:
+        if not self.__cached_update:
             self._download_update()
-        return self.__cached_update_by_modname.get(modname)
+        return self.__cached_update.by_name(modname)
 
     def update_data_for_gbid(self, gbid):
-        if not self.__cached_update_by_gbid:
+        if not self.__cached_update:
+            self._download_update()
+        return self.__cached_update.by_gbid(gbid)
+
+    def update_data_for_gbfileid(self, fileid):
+        if not self.__cached_update:
             self._download_update()
-        return self.__cached_update_by_gbid.get(gbid)
+        return self.__cached_update.by_file_id(fileid)
 
     def update_mod(self, modname, save_path, moddata):
+        save_path = os.fspath(save_path)
         urls = [
-            moddata["MirrorURL"],
-            moddata["URL"],
+            moddata.mirror_url,
+            moddata.url,
         ]
 
-        # FIXME: rare cases (Collab-2018-10) have multiple hashes; why?
-        xxhash = moddata.get("xxHash")
+        # prefer XXH3 when the manifest publishes it, it's much faster;
+        # the chunked variant can additionally be computed on all cores
+        xxhash = moddata.xxhashes3_chunked
+        algorithm = ChunkedXXH3
+        if not xxhash:
+            xxhash = moddata.xxhashes3
+            algorithm = xxh3_64
+        if not xxhash:
+            # FIXME: rare cases (Collab-2018-10) have multiple hashes; why?
+            xxhash = moddata.xxhashes
+            algorithm = xxh64
+        hasher = None
         if xxhash:
             assert len(xxhash) == 1
             xxhash = xxhash[0]
+            hasher = algorithm()
 
-        size = moddata.get("Size")
-
-        filepath = save_path.joinpath(f"{modname}.zip")
-        for url in urls:
-            try:
-                self.dlr.download(url, modname, filepath, size)
-                break
-            except requests.HTTPError:
-                continue
-            print(f"Could not download file {modname} from {urls}!")
-            return False
+        size = moddata.size
 
-        if not filepath.exists():
-            print(f"Could not find downloaded file {filepath}")
-            return False
+        staging_dir = get_staging_dir(save_path, size)
+        filepath = f"{staging_dir}/{modname}.zip"
+        try:
+            # an earlier run may have been interrupted after the download finished
+            reuse = False
+            if xxhash and os.path.exists(filepath):
+                reuse = hash_file(filepath, algorithm) == xxhash
+                if reuse:
+                    self.dlr.message(f"Using previously downloaded {filepath}.")
 
-        if xxhash:
-            with open(filepath, "rb") as f:
-                if not xxhsum(f) == xxhash:
-                    print(f"Downloaded file did not match hash for {filepath}!")
+            if not reuse:
+                try:
+                    downloaded = self._download_any(
+                        urls, modname, filepath, size, hasher
+                    )
+                except OSError as e:
+                    # other downloads may have used up the space in tmpfs
+                    if e.errno != errno.ENOSPC or staging_dir == save_path:
+                        raise
+                    self.dlr.message(
+                        f"Out of space in {staging_dir}, retrying in {save_path}..."
+                    )
+                    os.unlink(filepath)
+                    staging_dir = save_path
+                    filepath = f"{staging_dir}/{modname}.zip"
+                    if xxhash:
+                        hasher = algorithm()
+                    downloaded = self._download_any(
+                        urls, modname, filepath, size, hasher
+                    )
+                if not downloaded:
+                    self.dlr.message(f"Could not download file {modname} from {urls}!")
                     return False
-        else:
-            print(f"Warning: no hash available for {filepath}!")
 
-        dirpath = save_path.joinpath(f"{modname}")
-        if not dirpath.is_dir():
-            print(f"Note: {modname} has no existing version.")
-        else:
-            # print(f"Removing previous version of {modname}...")
-            rmtree(dirpath)
-
-        dirpath.mkdir()
-        with ZipFile(filepath) as zf:
-            zf.extractall(dirpath)
-
-        # users can selectively disable levelsets included in some helpers
-        if modname in self.__disabled_levelsets:
-            print(f"Disabling levelsets for {modname}...")
-            mappath = dirpath.joinpath("Maps")
-            targetpath = dirpath.joinpath("_Maps")
-            if mappath.is_dir():
-                if not targetpath.is_dir():
-                    mappath.rename(targetpath)
+                # the hash was computed while the file was being written
+                if xxhash:
+                    if not hasher.hexdigest() == xxhash:
+                        self.dlr.message(
+                            f"Downloaded file did not match hash for {filepath}!"
+                        )
+                        os.unlink(filepath)
+                        return False
                 else:
-                    print(
-                        f"Warning: {mappath} would be moved but target directory exists!"
-                    )
+                    self.dlr.message(f"Warning: no hash available for {filepath}!")
 
-        filepath.unlink()
-        return True
+            dirpath = f"{save_path}/{modname}"
+            if not os.path.isdir(dirpath):
+                self.dlr.message(f"Note: {modname} has no existing version.")
+            else:
+                # print(f"Removing previous version of {modname}...")
+                rmtree(dirpath)
+
+            os.mkdir(dirpath)
+            # without a verified archive hash every member's CRC is checked
+            extract_zip(filepath, dirpath, verified=bool(xxhash))
+
+            # users can selectively disable levelsets included in some helpers
+            if modname in self.__disabled_levelsets:
+                self.dlr.message(f"Disabling levelsets for {modname}...")
+                mappath = f"{dirpath}/Maps"
+                targetpath = f"{dirpath}/_Maps"
+                if os.path.isdir(mappath):
+                    if not os.path.isdir(targetpath):
+                        os.rename(mappath, targetpath)
+                    else:
+                        self.dlr.message(
+                            f"Warning: {mappath} would be moved but target directory exists!"
+                        )
+
+            os.unlink(filepath)
+            return True
+        finally:
+            # never leave archives behind in memory; on disk they are kept after
+            # a failure so that a later run can reuse them
+            if staging_dir != save_path:
+                try:
+                    os.unlink(filepath)
+                except FileNotFoundError:
+                    pass
+
+    def _download_any(self, urls, modname, filepath, size, hasher):
+        for url in urls:
+            try:
+                self.dlr.download(url, modname, filepath, size, hasher)
+                return True
+            except requests.HTTPError:
+                continue
+        return False
 
     def update(self, location):
+        location = os.fspath(location)
         print("Parsing existing mods")
         mods = {}
-        for loc in filter(lambda x: x.is_dir(), Path(location).glob("*")):
-            yaml = get_mod_yaml(loc)
+        with os.scandir(location) as it:
+            locs = [
+                entry.path
+                for entry in it
+                if entry.is_dir() and not entry.name.startswith(".")
+            ]
+        with ThreadPoolExecutor(max_workers=YAML_WORKERS) as pool:
+            yamls = list(pool.map(get_mod_yaml, locs))
+        for loc, yaml in zip(locs, yamls):
             for mod in yaml:
-                mods[mod["Name"]] = {
+                mods[mod.Name] = {
                     "path": loc,
-                    "dependencies": mod["Dependencies"],
-                    "version": mod["Version"],
+                    "dependencies": mod.Dependencies,
+                    "version": mod.Version,
                 }
         wanted = set(mods.keys())
         wanted |= set(
-            [dep["Name"] for mod in mods.values() for dep in mod["dependencies"]]
+            [dep.Name for mod in mods.values() for dep in mod["dependencies"]]
         )
         have = {"Everest", "EverestCore", "Celeste"}
         wanted -= have
 
+        # load the update data up front, not from several workers at once
+        if wanted and not self.__cached_update:
+            self._download_update()
+
         print("Updating mods...")
-        while wanted:
-            modname = wanted.pop()
-            moddata = self.update_data_for_mod(modname)
-            have.add(modname)
-            needs_download = False
+        seen = have | wanted
+        pending = queue.Queue()
+        for modname in wanted:
+            pending.put(modname)
+        lock = threading.Lock()
+        failed = threading.Event()
+        errors = []
+
+        def worker():
+            while True:
+                modname = pending.get()
+                try:
+                    if modname is None:
+                        return
+                    if failed.is_set():
+                        continue
+                    new_deps = self._update_one(modname, mods, location)
+                    if new_deps is None:
+                        failed.set()
+                        continue
+                    with lock:
+                        for depmodname in new_deps:
+                            if depmodname not in seen:
+                                self.dlr.message(
+                                    f"{modname} has new dependency {depmodname}"
+                                )
+                                seen.add(depmodname)
+                                pending.put(depmodname)
+                except Exception as e:
+                    errors.append(e)
+                    failed.set()
+                finally:
+                    pending.task_done()
+
+        with ThreadPoolExecutor(max_workers=UPDATE_WORKERS) as pool:
+            for _ in range(UPDATE_WORKERS):
+                pool.submit(worker)
+            try:
+                pending.join()
+            except BaseException:
+                failed.set()
+                raise
+            finally:
+                for _ in range(UPDATE_WORKERS):
+                    pending.put(None)
+        if errors:
+            raise errors[0]
+
+    def _update_one(self, modname, mods, location):
+        # returns the dependencies of the updated mod, or None on failure
+        moddata = self.update_data_for_mod(modname)
+        needs_download = False
 
-            if modname not in mods:
+        if modname not in mods:
+            needs_download = True
+        elif moddata:
+            current_version = version.parse(mods[modname]["version"])
+            server_version = version.parse(moddata.version)
+            if server_version > current_version:
                 needs_download = True
-            elif moddata:
-                current_version = version.parse(mods[modname]["version"])
-                server_version = version.parse(moddata["Version"])
-                if server_version > current_version:
-                    needs_download = True
-
-            if needs_download:
-                if not moddata:
-                    print(f"Could not find update data for {modname}!")
-                    break
-                result = self.update_mod(modname, location, moddata)
-                if not result:
-                    break
-                yaml = get_mod_yaml(location / modname)
-                for mod in yaml:
-                    for depmod in mod["Dependencies"]:
-                        depmodname = depmod["Name"]
-                        if depmodname not in have and depmodname not in wanted:
-                            print(f"{modname} has new dependency {depmodname}")
-                            wanted.add(depmodname)
+
+        if not needs_download:
+            return []
+        if not moddata:
+            self.dlr.message(f"Could not find update data for {modname}!")
+            return None
+        result = self.update_mod(modname, location, moddata)
+        if not result:
+            return None
+        yaml = get_mod_yaml(f"{location}/{modname}")
+        return [depmod.Name for mod in yaml for depmod in mod.Dependencies]
 
     def download(self, location, identifier):
         moddata = None
@@ -283,23 +1033,25 @@ class ModUpdater:
         elif identifier.startswith("https://gamebanana.com"):
             mod_id = get_id_from_url(identifier)
             if mod_id:
-                moddata = self.update_data_for_gbid(mod_id)
+                # download links carry the id of the file, not of the mod
+                if "dl/" in identifier:
+                    moddata = self.update_data_for_gbfileid(mod_id)
+                else:
+                    moddata = self.update_data_for_gbid(mod_id)
                 # try to download file directly when it's not on the mirrors yet
                 if not moddata and "dl/" in identifier:
                     print("File not in database, attempting direct download.")
-                    moddata = {
-                        "Name": "fake_mod_download",
-                        "MirrorURL": MIRROR_URL % mod_id,
-                        "URL": identifier,
-                    }
+                    moddata = ModData(
+                        "fake_mod_download", MIRROR_URL % mod_id, identifier
+                    )
                     result = self.update_mod("fake_mod_download", location, moddata)
                     mod_location = location / "fake_mod_download"
                     if result and mod_location.is_dir():
                         yaml = get_mod_yaml(mod_location)
                         if len(yaml) == 1:
-                            real_modname = yaml[0]["Name"]
+                            real_modname = yaml[0].Name
                         else:
-                            mnames = [mod["Name"] for mod in yaml if "DLL" not in mod]
+                            mnames = [mod.Name for mod in yaml if mod.DLL is None]
                             if len(mnames) > 1:
                                 print("Note: the manifest for {mod_id} contains multiple named mods. The first valid name {mnames[0]} will be used.")
                             real_modname = mnames[0]
@@ -310,7 +1062,7 @@ class ModUpdater:
             moddata = self.update_data_for_mod(identifier)
 
         if moddata:
-            modname = moddata["Name"]
+            modname = moddata.name
             if self.update_mod(modname, location, moddata):
                 print("Mod installed. Run an update to pull in any dependencies.")
 